@@ -3,6 +3,8 @@ Environment for Behave Testing
 """
 
 from os import getenv
+import requests
+from requests.adapters import HTTPAdapter
 from selenium import webdriver
 
 WAIT_SECONDS = int(getenv("WAIT_SECONDS", "60"))
@@ -20,12 +22,15 @@ def before_all(context):
     else:
         context.driver = get_chrome()
     context.driver.implicitly_wait(context.wait_seconds)
+    # Share one pool of keep-alive connections across all REST API calls
+    context.http = get_http_session()
     context.config.setup_logging()
 
 
 def after_all(context):
     """Executed after all tests"""
     context.driver.quit()
+    context.http.close()
 
 
 ######################################################################
@@ -33,6 +38,16 @@ def after_all(context):
 ######################################################################
 
 
+def get_http_session():
+    """Creates a requests Session that reuses pooled connections"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=20, max_retries=3)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["Content-Type"] = "application/json"
+    return session
+
+
 def get_chrome():
     """Creates a headless Chrome driver"""
     options = webdriver.ChromeOptions()
@@ -22,8 +22,6 @@ Steps file for Customers.feature
 For information on Waiting until elements are present in the HTML see:
     https://selenium-python.readthedocs.io/waits.html
 """
-import requests
-
 # pylint: disable=no-name-in-module
 from behave import given
 
@@ -37,21 +35,26 @@ HTTP_204_NO_CONTENT = 204
 def step_impl(context):
     """Delete all Customers and load new ones"""
 
-    # List all of the customers and delete them one by one
+    # Delete all of the customers with one request when the service allows it
     rest_endpoint = f"{context.base_url}/api/customers"
-    context.resp = requests.get(rest_endpoint)
-    assert context.resp.status_code == HTTP_200_OK
-    for customer in context.resp.json():
-        context.resp = requests.delete(f"{rest_endpoint}/{customer['id']}")
-        assert context.resp.status_code == HTTP_204_NO_CONTENT
-
-    # load the database with new customers
-    for row in context.table:
-        payload = {
+    context.resp = context.http.delete(rest_endpoint)
+    if context.resp.status_code != HTTP_204_NO_CONTENT:
+        # otherwise list all of the customers and delete them one by one
+        context.resp = context.http.get(rest_endpoint)
+        assert context.resp.status_code == HTTP_200_OK
+        for customer in context.resp.json():
+            context.resp = context.http.delete(f"{rest_endpoint}/{customer['id']}")
+            assert context.resp.status_code == HTTP_204_NO_CONTENT
+
+    # load the database with new customers in a single request
+    payload = [
+        {
             "name": row["name"],
             "address": row["address"],
             "email": row["email"],
             "phonenumber": row["phonenumber"],
         }
-        context.resp = requests.post(rest_endpoint, json=payload)
-        assert context.resp.status_code == HTTP_201_CREATED
+        for row in context.table
+    ]
+    context.resp = context.http.post(f"{rest_endpoint}/bulk", json=payload)
+    assert context.resp.status_code == HTTP_201_CREATED
@@ -17,8 +17,33 @@
 Flask CLI Command Extensions
 """
 from flask import current_app as app  # Import Flask application
+from sqlalchemy import text
 from service.models import db
 
+# db.create_all() never alters a table that already exists, so these bring a
+# PostgreSQL database from an earlier release up to the current schema
+UPGRADE_STATEMENTS = (
+    "CREATE INDEX IF NOT EXISTS ix_customer_name ON customer (name)",
+    "CREATE INDEX IF NOT EXISTS ix_customer_address ON customer (address)",
+    "CREATE INDEX IF NOT EXISTS ix_customer_phonenumber ON customer (phonenumber)",
+    # emails are unique ignoring case: every lookup goes through lower(email),
+    # so that index is the unique one and the plain email index goes away
+    """
+    DO $$
+    BEGIN
+        IF EXISTS (SELECT 1 FROM pg_index WHERE indexrelid =
+                   to_regclass('ix_customer_email_lower') AND NOT indisunique) THEN
+            DROP INDEX ix_customer_email_lower;
+        END IF;
+    END $$
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_customer_email_lower ON customer (lower(email))",
+    "DROP INDEX IF EXISTS ix_customer_email",
+    "ALTER TABLE customer ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITHOUT TIME ZONE"
+    " NOT NULL DEFAULT timezone('utc', statement_timestamp())",
+    "CREATE INDEX IF NOT EXISTS ix_customer_updated_at ON customer (updated_at)",
+)
+
 
 ######################################################################
 # Command to force tables to be rebuilt
@@ -34,3 +59,19 @@ def db_create():
     db.drop_all()
     db.create_all()
     db.session.commit()
+
+
+######################################################################
+# Command to upgrade the tables of an existing database
+# Usage:
+#   flask db-upgrade
+######################################################################
+@app.cli.command("db-upgrade")
+def db_upgrade():
+    """
+    Upgrades an existing PostgreSQL database to the current schema. Every
+    statement is safe to run again on a database that is already current.
+    """
+    for statement in UPGRADE_STATEMENTS:
+        db.session.execute(text(statement))
+    db.session.commit()
@@ -19,16 +19,28 @@ Module: error_handlers
 from flask import jsonify
 from flask import current_app as app  # Import Flask application
 from service.models import DataValidationError
+from service.routes import api
 from . import status
 
 
 ######################################################################
 # Error Handlers
 ######################################################################
-@app.errorhandler(DataValidationError)
-def request_validation_error(error):
-    """Handles Value Errors from bad data"""
-    return bad_request(error)
+@api.errorhandler(DataValidationError)
+def api_validation_error(error):
+    """Handles Value Errors from bad data sent to the REST API
+
+    Flask-RESTX catches exceptions raised in its resources before Flask's
+    own handlers see them, unless exceptions propagate (as they do under
+    TESTING or DEBUG), so the API needs a handler of its own
+    """
+    message = str(error)
+    app.logger.warning(message)
+    return {
+        "status": status.HTTP_400_BAD_REQUEST,
+        "error": "Bad Request",
+        "message": message,
+    }, status.HTTP_400_BAD_REQUEST
 
 
 @app.errorhandler(status.HTTP_400_BAD_REQUEST)
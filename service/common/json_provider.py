@@ -0,0 +1,36 @@
+"""
+JSON Provider
+
+This module contains a Flask JSON provider and a Flask-RESTX representation
+that use orjson to parse requests and serialize responses
+"""
+import orjson
+from flask import make_response
+from flask.json.provider import DefaultJSONProvider
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by the orjson C extension"""
+
+    def dumps(self, obj, **kwargs):
+        """Serializes obj to a JSON string, ignoring the stdlib json options"""
+        return orjson.dumps(
+            obj, default=self.default, option=orjson.OPT_NON_STR_KEYS
+        ).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        """Parses a JSON str or bytes without decoding it first"""
+        return orjson.loads(s)
+
+
+def output_json(data, code, headers=None):
+    """Makes a Flask-RESTX response with an orjson encoded body"""
+    dumped = orjson.dumps(
+        data,
+        default=DefaultJSONProvider.default,
+        option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE,
+    )
+    resp = make_response(dumped, code)
+    resp.mimetype = "application/json"
+    resp.headers.extend(headers or {})
+    return resp
@@ -3,6 +3,7 @@ Global Configuration for Application
 """
 import os
 import logging
+from sqlalchemy.pool import StaticPool
 
 # Get configuration from environment
 DATABASE_URI = os.getenv(
@@ -13,7 +14,40 @@ DATABASE_URI = os.getenv(
 # Configure SQLAlchemy
 SQLALCHEMY_DATABASE_URI = DATABASE_URI
 SQLALCHEMY_TRACK_MODIFICATIONS = False
-# SQLALCHEMY_POOL_SIZE = 2
+
+# Keep a warm pool of database connections instead of reconnecting per request.
+# Keep DB_POOL_SIZE x gunicorn workers below the server's max_connections.
+DB_POOL_OPTIONS = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "20")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "40")),
+    "pool_pre_ping": True,
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    "pool_use_lifo": True,
+}
+
+
+def pool_options(uri):
+    """Returns the connection pool options that suit the database at uri"""
+    if uri in ("sqlite://", "sqlite:///:memory:"):
+        # an in-memory database lives in one connection, so every session shares it
+        return {"poolclass": StaticPool, "connect_args": {"check_same_thread": False}}
+    if uri.startswith("sqlite"):
+        # SQLite does not take the QueuePool sizing options
+        return {}
+    return DB_POOL_OPTIONS
+
+
+# The filter and page combinations of the list query make a few dozen distinct
+# statements, so keep every compiled form cached instead of recompiling them.
+# Bulk inserts are sent as multi-row INSERT ... VALUES statements of this many rows.
+SQLALCHEMY_ENGINE_OPTIONS = {
+    "query_cache_size": int(os.getenv("DB_QUERY_CACHE_SIZE", "1200")),
+    "insertmanyvalues_page_size": int(os.getenv("DB_INSERT_PAGE_SIZE", "1000")),
+    **pool_options(DATABASE_URI),
+}
+
+# Allow DELETE /api/customers to remove every customer (test environments only)
+ALLOW_DELETE_ALL = os.getenv("ALLOW_DELETE_ALL", "False").lower() == "true"
 
 # Secret for session management
 SECRET_KEY = os.getenv("SECRET_KEY", "sup3r-s3cr3t")
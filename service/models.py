@@ -5,19 +5,78 @@ All of the models are stored in this module
 """
 
 import logging
+import sqlite3
+from datetime import datetime, timezone
+import fastjsonschema
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import delete, event, func, insert, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
 
 logger = logging.getLogger("flask.app")
 
 # Create the SQLAlchemy object to be initialized later in init_db()
 db = SQLAlchemy()
 
+# The fields that deserialize() accepts, in column order
+CUSTOMER_FIELDS = ("name", "address", "email", "phonenumber")
+
+# Compiled once at import into a validator specialized to this schema
+CUSTOMER_SCHEMA = {
+    "type": "object",
+    "required": list(CUSTOMER_FIELDS),
+    "properties": {
+        "id": {"type": ["integer", "null"]},
+        "name": {"type": "string", "maxLength": 63},
+        "address": {"type": "string", "maxLength": 256},
+        "email": {"type": "string", "maxLength": 50},
+        "phonenumber": {"type": "string", "maxLength": 25},
+    },
+    "additionalProperties": False,
+}
+validate_customer = fastjsonschema.compile(CUSTOMER_SCHEMA)
+
+# Batches at least this large are loaded with COPY on PostgreSQL
+COPY_THRESHOLD = 100
+COPY_COLUMNS = CUSTOMER_FIELDS
+
+
+class utc_now(FunctionElement):  # pylint: disable=invalid-name, too-many-ancestors
+    """The database's current UTC time, so every row is stamped on one clock"""
+
+    type = db.DateTime()
+    inherit_cache = True
+
+
+@compiles(utc_now)
+def _utc_now(_element, _compiler, **_kw):
+    # the statement's own start, so writes in one transaction still move forward
+    return "timezone('utc', statement_timestamp())"
+
+
+@compiles(utc_now, "sqlite")
+def _utc_now_sqlite(_element, _compiler, **_kw):
+    # SQLite only keeps milliseconds; it runs in-process, so Python's clock is its clock
+    return "utc_now()"
+
+
+@event.listens_for(Engine, "connect")
+def _register_utc_now(dbapi_connection, _connection_record):
+    """Provides utc_now() on SQLite connections"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function(
+            "utc_now",
+            0,
+            lambda: datetime.now(timezone.utc).replace(tzinfo=None).isoformat(" ", "microseconds"),
+        )
+
 
 class DataValidationError(Exception):
     """Used for an data validation errors when deserializing"""
 
 
-class Customer(db.Model):
+class Customer(db.Model):  # pylint: disable=too-many-public-methods
     """
     Class that represents a Customer
     """
@@ -26,10 +85,25 @@ class Customer(db.Model):
     # Table Schema
     ##################################################
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(63))
-    address = db.Column(db.String(256))
+    name = db.Column(db.String(63), index=True)
+    address = db.Column(db.String(256), index=True)
     email = db.Column(db.String(50))
-    phonenumber = db.Column(db.String(25))
+    phonenumber = db.Column(db.String(25), index=True)
+    # Stamped by the database, never by the app host, so the ETags of every
+    # host agree; the server default also covers rows loaded with COPY
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        onupdate=utc_now(),
+        server_default=utc_now(),
+        index=True,
+    )
+
+    # Serves the case-insensitive email lookups, and keeps emails unique the
+    # same way they are looked up, so A@x.com and a@x.com are one customer
+    __table_args__ = (
+        db.Index("ix_customer_email_lower", func.lower(email), unique=True),
+    )
 
     def __repr__(self):
         return f"<Customer {self.name} id=[{self.id}]>"
@@ -38,40 +112,32 @@ class Customer(db.Model):
         """
         Creates a Customer to the database
         """
-        logger.info("Creating %s", self.name)
+        logger.debug("Creating %s", self.name)
         self.id = None  # pylint: disable=invalid-name
+        values = self.serialize()
+        del values["id"]
+        # a Core INSERT ... RETURNING skips the identity map and post-flush refresh
+        stmt = insert(Customer).values(**values).returning(Customer.id)
         try:
-            db.session.add(self)
+            new_id = db.session.execute(stmt).scalar_one()
             db.session.commit()
         except Exception as e:
             db.session.rollback()
             logger.error("Error creating record: %s", self)
             raise DataValidationError(e) from e
+        self.id = new_id
 
     def update(self):
         """
         Updates a Customer to the database
         """
-        logger.info("Saving %s", self.name)
         if self.id is None:
             raise DataValidationError("Cannot update a customer with no ID")
-        try:
-            db.session.commit()
-        except Exception as e:
-            db.session.rollback()
-            logger.error("Error updating record: %s", self)
-            raise DataValidationError(e) from e
+        Customer.update_by_id(self.id, self)
 
     def delete(self):
         """Removes a Customer from the data store"""
-        logger.info("Deleting %s", self.name)
-        try:
-            db.session.delete(self)
-            db.session.commit()
-        except Exception as e:
-            db.session.rollback()
-            logger.error("Error deleting record: %s", self)
-            raise DataValidationError(e) from e
+        Customer.delete_by_id(self.id)
 
     def serialize(self):
         """Serializes a Customer into a dictionary"""
@@ -91,59 +157,213 @@ class Customer(db.Model):
             data (dict): A dictionary containing the resource data
         """
         try:
-            if not isinstance(data["name"], str):
-                raise DataValidationError(
-                    "Invalid type for [name]: " + str(type(data["name"]))
-                )
-            self.name = data["name"]
-
-            if not isinstance(data["address"], str):
-                raise DataValidationError(
-                    "Invalid type for [address]: " + str(type(data["address"]))
-                )
-            self.address = data["address"]
-
-            if not isinstance(data["email"], str):
-                raise DataValidationError(
-                    "Invalid type for [email]: " + str(type(data["email"]))
-                )
-            self.email = data["email"]
-
-            if not isinstance(data["phonenumber"], str):
-                raise DataValidationError(
-                    "Invalid type for [phonenumber]: " + str(type(data["phonenumber"]))
-                )
-            self.phonenumber = data["phonenumber"]
-
-        except AttributeError as error:
-            raise DataValidationError("Invalid attribute: " + error.args[0]) from error
-        except KeyError as error:
-            raise DataValidationError(
-                "Invalid Customer: missing " + error.args[0]
-            ) from error
-        except TypeError as error:
-            raise DataValidationError(
-                "Invalid Customer: body of request contained bad or no data "
-                + str(error)
-            ) from error
+            validate_customer(data)
+        except fastjsonschema.JsonSchemaException as error:
+            raise DataValidationError("Invalid Customer: " + error.message) from error
+        for field in CUSTOMER_FIELDS:
+            setattr(self, field, data[field])
         return self
 
     ##################################################
     # CLASS METHODS
     ##################################################
 
+    @classmethod
+    def bulk_create(cls, customers):
+        """
+        Creates a batch of Customers in a single transaction
+
+        Args:
+            customers (list): the deserialized Customers to insert
+        """
+        logger.debug("Bulk creating %d Customers", len(customers))
+        if not customers:
+            # an executemany with no parameter sets runs a plain INSERT of one empty row
+            return customers
+        mappings = [customer.serialize() for customer in customers]
+        for mapping in mappings:
+            mapping.pop("id")
+        try:
+            # one INSERT ... RETURNING for the whole batch, ids in posted order
+            result = db.session.execute(
+                insert(cls).returning(cls.id, sort_by_parameter_order=True), mappings
+            )
+            ids = result.scalars().all()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error bulk creating %d records", len(customers))
+            raise DataValidationError(e) from e
+        for customer, new_id in zip(customers, ids):
+            customer.id = new_id
+        return customers
+
+    @classmethod
+    def bulk_load(cls, rows):
+        """
+        Loads a batch of Customers without returning their ids
+
+        Large batches on PostgreSQL are streamed with COPY ... FROM STDIN,
+        everything else is sent as a single multi-row INSERT
+
+        Args:
+            rows (list): dictionaries with the name, address, email and phonenumber
+        """
+        logger.debug("Bulk loading %d Customers", len(rows))
+        if not rows:
+            return 0
+        try:
+            if len(rows) >= COPY_THRESHOLD and db.engine.dialect.name == "postgresql":
+                cls._copy_rows(rows)
+            else:
+                db.session.execute(insert(cls), rows)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error bulk loading %d records", len(rows))
+            raise DataValidationError(e) from e
+        return len(rows)
+
+    @classmethod
+    def _copy_rows(cls, rows):
+        """Streams rows into the table with COPY on the raw psycopg connection"""
+        raw = db.session.connection().connection
+        sql = f"COPY {cls.__tablename__} ({', '.join(COPY_COLUMNS)}) FROM STDIN"
+        with raw.cursor() as cursor:
+            with cursor.copy(sql) as copy:
+                for row in rows:
+                    copy.write_row([row[column] for column in COPY_COLUMNS])
+
+    @classmethod
+    def update_by_id(cls, by_id, customer):
+        """
+        Updates a Customer with a single UPDATE ... RETURNING statement
+
+        Args:
+            by_id (int): the id of the Customer to update
+            customer (Customer): a deserialized Customer holding the new values
+
+        Returns the updated Customer as a dictionary, or None if it does not exist
+        """
+        logger.debug("Updating id %s to %s", by_id, customer.name)
+        values = customer.serialize()
+        del values["id"]
+        stmt = (
+            update(cls)
+            .where(cls.id == by_id)
+            .values(**values)
+            .returning(cls.id, cls.name, cls.address, cls.email, cls.phonenumber)
+        )
+        try:
+            row = db.session.execute(stmt).mappings().one_or_none()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error updating record with id %s", by_id)
+            raise DataValidationError(e) from e
+        return dict(row) if row else None
+
+    @classmethod
+    def delete_by_id(cls, by_id):
+        """
+        Removes a Customer with a single DELETE ... RETURNING statement
+
+        Args:
+            by_id (int): the id of the Customer to delete
+
+        Returns the id of the deleted Customer, or None if it did not exist
+        """
+        logger.debug("Deleting id %s", by_id)
+        stmt = delete(cls).where(cls.id == by_id).returning(cls.id)
+        try:
+            deleted = db.session.execute(stmt).scalar_one_or_none()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error deleting record with id %s", by_id)
+            raise DataValidationError(e) from e
+        return deleted
+
+    @classmethod
+    def remove_all(cls):
+        """Removes all of the Customers from the database in one statement"""
+        logger.debug("Removing all Customers")
+        try:
+            db.session.execute(delete(cls))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error removing all records")
+            raise DataValidationError(e) from e
+
     @classmethod
     def all(cls):
         """Returns all of the Customers in the database"""
-        logger.info("Processing all Customers")
+        logger.debug("Processing all Customers")
         return cls.query.all()
 
+    @classmethod
+    def all_serialized(cls, limit=None, offset=None, filters=None):
+        """Returns the Customers ordered by id as serialized dictionaries
+
+        The columns are selected directly so no ORM objects are built
+
+        Args:
+            limit (int): the most Customers to return, or None for all of them
+            offset (int): the number of Customers to skip
+            filters (dict): the column names and values that must all match
+        """
+        logger.debug("Processing Customers as dictionaries for %s", filters)
+        stmt = select(cls.id, cls.name, cls.address, cls.email, cls.phonenumber)
+        if filters:
+            stmt = cls._where(stmt, filters)
+        stmt = stmt.order_by(cls.id).limit(limit).offset(offset)
+        rows = db.session.execute(stmt).all()
+        return [
+            {
+                "id": id_,
+                "name": name,
+                "address": address,
+                "email": email,
+                "phonenumber": phonenumber,
+            }
+            for id_, name, address, email, phonenumber in rows
+        ]
+
+    @classmethod
+    def version(cls):
+        """Returns the (count, latest updated_at) of the Customers
+
+        A write that commits after the last read normally changes one of the
+        two. Rows are stamped when their statement starts, though, so an update
+        that started before a later write but commits after it leaves both
+        unchanged, and that update shows up in the ETag only at the next write
+        """
+        stmt = select(func.count(cls.id), func.max(cls.updated_at))
+        return tuple(db.session.execute(stmt).one())
+
     @classmethod
     def find(cls, by_id):
         """Finds a Customer by it's ID"""
-        logger.info("Processing lookup for id %s ...", by_id)
+        logger.debug("Processing lookup for id %s ...", by_id)
         return cls.query.session.get(cls, by_id)
 
+    @classmethod
+    def find_serialized(cls, by_id):
+        """Finds a Customer by it's ID as a serialized dictionary
+
+        The dictionary also holds updated_at so callers can version it
+
+        Args:
+            by_id (int): the id of the Customer to find
+        """
+        logger.debug("Processing serialized lookup for id %s ...", by_id)
+        stmt = select(
+            cls.id, cls.name, cls.address, cls.email, cls.phonenumber, cls.updated_at
+        ).where(cls.id == by_id)
+        row = db.session.execute(stmt).mappings().one_or_none()
+        return dict(row) if row else None
+
     @classmethod
     def find_by_name(cls, name):
         """Returns all Customers with the given name
@@ -151,7 +371,7 @@ class Customer(db.Model):
         Args:
             name (string): the name of the Customers you want to match
         """
-        logger.info("Processing name query for %s ...", name)
+        logger.debug("Processing name query for %s ...", name)
         return cls.query.filter(cls.name == name)
 
     @classmethod
@@ -161,18 +381,18 @@ class Customer(db.Model):
         Args:
             address (string): the address of the Customers you want to match
         """
-        logger.info("Processing address query for %s ...", address)
+        logger.debug("Processing address query for %s ...", address)
         return cls.query.filter(cls.address == address)
 
     @classmethod
     def find_by_email(cls, email):
-        """Returns all Customers with the given email
+        """Returns all Customers with the given email, ignoring case
 
         Args:
             email (string): the email of the Customers you want to match
         """
-        logger.info("Processing email query for %s ...", email)
-        return cls.query.filter(cls.email == email)
+        logger.debug("Processing email query for %s ...", email)
+        return cls.query.filter(func.lower(cls.email) == email.lower())
 
     @classmethod
     def find_by_phonenumber(cls, phonenumber):
@@ -181,19 +401,29 @@ class Customer(db.Model):
         Args:
             phonenumber (string): the phonenumber of the Customers you want to match
         """
-        logger.info("Processing phonenumber query for %s ...", phonenumber)
+        logger.debug("Processing phonenumber query for %s ...", phonenumber)
         return cls.query.filter(cls.phonenumber == phonenumber)
 
     @classmethod
     def find_by_name_and_email(cls, name, email):
-        """Finds a customer by both name and email"""
-        logger.info("Processing name & email query for %s, %s ...", name, email)
-        return cls.query.filter(cls.name == name, cls.email == email)
+        """Finds a customer by both name and email, ignoring the case of the email"""
+        logger.debug("Processing name & email query for %s, %s ...", name, email)
+        return cls.query.filter(cls.name == name, func.lower(cls.email) == email.lower())
+
+    @classmethod
+    def _where(cls, stmt, filters):
+        """Adds a WHERE clause to stmt for each of the column filters"""
+        for column, value in filters.items():
+            if column == "email":
+                stmt = stmt.where(func.lower(cls.email) == value.lower())
+            else:
+                stmt = stmt.where(getattr(cls, column) == value)
+        return stmt
 
     @classmethod
     def find_all_sorted_by_name(cls, order="asc"):
         """Returns all Customers sorted by name (default: ascending)"""
-        logger.info("Processing sorted query for customers by name")
+        logger.debug("Processing sorted query for customers by name")
         if order == "desc":
             return cls.query.order_by(cls.name.desc())
         return cls.query.order_by(cls.name.asc())
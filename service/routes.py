@@ -5,11 +5,22 @@ This service implements a REST API that allows you to Create, Read, Update
 and Delete Customer
 """
 
-from flask import abort
+import logging
+import zlib
+from datetime import datetime
+from functools import cache
+from urllib.parse import urlencode
+import orjson
+from flask import Response, abort, request
 from flask import current_app as app  # Import Flask application
-from flask_restx import Resource, fields, reqparse, Api
-from service.models import Customer
+from flask_restx import Resource, fields, inputs, reqparse, Api
+from werkzeug.http import quote_etag
+from service.models import Customer, DataValidationError
 from service.common import status  # HTTP Status Codes
+from service.common.json_provider import output_json
+
+# Resolve the current_app proxy once; routes is imported inside the app context
+logger = app.logger
 
 
 ######################################################################
@@ -25,15 +36,21 @@ api = Api(
     doc="/apidocs",
     prefix="/api",
 )
+# Render every API response with orjson instead of the stdlib json module
+api.representation("application/json")(output_json)
 
 
 ######################################################################
 # GET HEALTH CHECK
 ######################################################################
+# Probes hit this often, so the body is serialized once at import
+HEALTH_BODY = orjson.dumps({"message": "Healthy"})
+
+
 @app.route("/health")
 def health_check():
     """Let them know our heart is still beating"""
-    return {"message": "Healthy"}, status.HTTP_200_OK
+    return Response(HEALTH_BODY, status=status.HTTP_200_OK, mimetype="application/json")
 
 
 ######################################################################
@@ -97,6 +114,9 @@ action_model = api.model(
 )
 
 # Query string arguments
+DEFAULT_PER_PAGE = 20
+MAX_PER_PAGE = 100
+
 customer_args = reqparse.RequestParser()
 customer_args.add_argument(
     "customer_id",
@@ -125,12 +145,56 @@ customer_args.add_argument(
     required=False,
     help="List Customers by phonenumber",
 )
+customer_args.add_argument(
+    "page",
+    type=inputs.positive,
+    location="args",
+    required=False,
+    help="The page of Customers to return, starting at 1",
+)
+customer_args.add_argument(
+    "per_page",
+    type=inputs.int_range(1, MAX_PER_PAGE),
+    location="args",
+    required=False,
+    help=f"The number of Customers per page (at most {MAX_PER_PAGE})",
+)
+
+# What parse_args() returns for a request without a query string
+NO_ARGS = {arg.name: None for arg in customer_args.args}
+
+# Maps Customer columns to the query string argument that filters on them
+FILTER_ARGS = {
+    "id": "customer_id",
+    "name": "name",
+    "address": "address",
+    "email": "email",
+    "phonenumber": "phonenumber",
+}
+
+
+def page_bounds(args):
+    """Returns the (limit, offset) for the requested page, or (None, None)"""
+    if args["page"] is None and args["per_page"] is None:
+        return None, None
+    per_page = args["per_page"] or DEFAULT_PER_PAGE
+    return per_page, ((args["page"] or 1) - 1) * per_page
+
+
+def next_page_link(args, limit, count):
+    """Returns a Link header pointing at the next page when there may be one"""
+    if limit is None or count < limit:
+        return {}
+    params = request.args.to_dict()
+    params["page"] = (args["page"] or 1) + 1
+    params["per_page"] = limit
+    return {"Link": f'<{request.base_url}?{urlencode(params)}>; rel="next"'}
 
 
 ######################################################################
 #  PATH: /customers/{id}
 ######################################################################
-@api.route("/customers/<customer_id>")
+@api.route("/customers/<int:customer_id>")
 @api.param("customer_id", "The Customer identifier")
 class CustomerResource(Resource):
     """
@@ -146,22 +210,27 @@ class CustomerResource(Resource):
     # RETRIEVE A CUSTOMER
     # ------------------------------------------------------------------
     @api.doc("get_customers")
+    @api.response(200, "Success", customer_model)
+    @api.response(304, "Customer not modified")
     @api.response(404, "Customer not found")
-    @api.marshal_with(customer_model)
     def get(self, customer_id):
         """
         Retrieve a single Customer
 
         This endpoint will return a Customer based on it's id
         """
-        app.logger.info("Request to Retrieve a customer with id [%s]", customer_id)
-        customer = Customer.find(customer_id)
+        logger.info("Request to Retrieve a customer with id [%s]", customer_id)
+        customer = Customer.find_serialized(customer_id)
         if not customer:
             abort(
                 status.HTTP_404_NOT_FOUND,
                 f"Customer with id '{customer_id}' was not found.",
             )
-        return customer.serialize(), status.HTTP_200_OK
+        etag = etag_for(customer["id"], customer.pop("updated_at"))
+        headers = {"ETag": quote_etag(etag, weak=True)}
+        if request.if_none_match.contains_weak(etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return customer, status.HTTP_200_OK, headers
 
     # ------------------------------------------------------------------
     # UPDATE AN EXISTING CUSTOMER
@@ -170,26 +239,25 @@ class CustomerResource(Resource):
     @api.response(404, "Customer not found")
     @api.response(400, "The posted Customer data was not valid")
     @api.expect(customer_model)
-    @api.marshal_with(customer_model)
+    @api.response(200, "Success", customer_model)
     def put(self, customer_id):
         """
         Update a Customer
 
         This endpoint will update a Customer based the body that is posted
         """
-        app.logger.info("Request to Update a customer with id [%s]", customer_id)
-        customer = Customer.find(customer_id)
-        if not customer:
+        logger.info("Request to Update a customer with id [%s]", customer_id)
+        check_content_type("application/json")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Payload = %s", api.payload)
+        customer = Customer().deserialize(api.payload)
+        updated = Customer.update_by_id(customer_id, customer)
+        if not updated:
             abort(
                 status.HTTP_404_NOT_FOUND,
                 f"Customer with id '{customer_id}' was not found.",
             )
-        app.logger.debug("Payload = %s", api.payload)
-        data = api.payload
-        customer.deserialize(data)
-        customer.id = customer_id
-        customer.update()
-        return customer.serialize(), status.HTTP_200_OK
+        return updated, status.HTTP_200_OK
 
     # ------------------------------------------------------------------
     # DELETE A CUSTOMER
@@ -202,12 +270,9 @@ class CustomerResource(Resource):
 
         This endpoint will delete a Customer based the id specified in the path
         """
-        app.logger.info("Request to Delete a customer with id [%s]", customer_id)
-        customer = Customer.find(customer_id)
-        if customer:
-            customer.delete()
-            app.logger.info("Customer with id [%s] was deleted", customer_id)
-        return "", status.HTTP_204_NO_CONTENT
+        deleted = Customer.delete_by_id(customer_id)
+        logger.info("Request to Delete customer [%s], deleted: %s", customer_id, bool(deleted))
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 ######################################################################
@@ -222,36 +287,29 @@ class CustomerCollection(Resource):
     # ------------------------------------------------------------------
     @api.doc("list_customers")
     @api.expect(customer_args, validate=True)
-    @api.marshal_list_with(customer_model)
+    @api.response(200, "Success", [customer_model])
+    @api.response(304, "Customers not modified")
     def get(self):
         """Returns all of the Customers"""
-        app.logger.info("Request to list Customers...")
-        customers = []
-        args = customer_args.parse_args()
-
-        if args["customer_id"]:
-            app.logger.info("Filtering by customer id: %s", args["customer_id"])
-            customer = Customer.find(args["customer_id"])
-            customers = [customer] if customer else []
-        elif args["name"]:
-            app.logger.info("Filtering by name: %s", args["name"])
-            customers = Customer.find_by_name(args["name"]).all()
-        elif args["address"]:
-            app.logger.info("Filtering by address: %s", args["address"])
-            customers = Customer.find_by_address(args["address"]).all()
-        elif args["email"]:
-            app.logger.info("Filtering by email: %s", args["email"])
-            customers = Customer.find_by_email(args["email"]).all()
-        elif args["phonenumber"]:
-            app.logger.info("Filtering by phonenumber: %s", args["phonenumber"])
-            customers = Customer.find_by_phonenumber(args["phonenumber"]).all()
-        else:
-            app.logger.info("Returning unfiltered list.")
-            customers = Customer.all()
-
-        app.logger.info("[%s] Customers returned", len(customers))
-        results = [customer.serialize() for customer in customers]
-        return results, status.HTTP_200_OK
+        # the common unfiltered request has nothing for reqparse to parse
+        args = customer_args.parse_args() if request.args else NO_ARGS
+        limit, offset = page_bounds(args)
+
+        # one small aggregate tells us whether any Customer changed, and the
+        # query string keeps each page and filter under an ETag of its own
+        etag = etag_for(*Customer.version(), zlib.crc32(request.query_string))
+        headers = {"ETag": quote_etag(etag, weak=True)}
+        if request.if_none_match.contains_weak(etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        # AND together every filter that was supplied into a single query
+        filters = {col: args[arg] for col, arg in FILTER_ARGS.items() if args[arg]}
+        # rows come back as column tuples, so no ORM objects are built
+        results = Customer.all_serialized(limit, offset, filters)
+
+        logger.info("[%s] Customers returned", len(results))
+        headers.update(next_page_link(args, limit, len(results)))
+        return results, status.HTTP_200_OK, headers
 
     # ------------------------------------------------------------------
     # ADD A NEW CUSTOMER
@@ -259,28 +317,77 @@ class CustomerCollection(Resource):
     @api.doc("create_customers")
     @api.response(400, "The posted data was not valid")
     @api.expect(customer_model)
-    @api.marshal_with(customer_model, code=201)
+    @api.response(201, "Customer created", customer_model)
     def post(self):
         """
         Creates a Customer
         This endpoint will create a Customer based the data in the body that is posted
         """
-        app.logger.info("Request to Create a Customer")
+        check_content_type("application/json")
         customer = Customer()
-        app.logger.debug("Payload = %s", api.payload)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Payload = %s", api.payload)
         customer.deserialize(api.payload)
         customer.create()
-        app.logger.info("Customer with new id [%s] created!", customer.id)
-        location_url = api.url_for(
-            CustomerResource, customer_id=customer.id, _external=True
-        )
+        logger.info("Customer with new id [%s] created!", customer.id)
+        location_url = request.host_url[:-1] + customer_path(customer.id)
         return customer.serialize(), status.HTTP_201_CREATED, {"Location": location_url}
 
+    # ------------------------------------------------------------------
+    # DELETE ALL CUSTOMERS
+    # ------------------------------------------------------------------
+    @api.doc("delete_all_customers")
+    @api.response(204, "All Customers deleted")
+    @api.response(403, "Deleting all Customers is not enabled")
+    def delete(self):
+        """
+        Delete all Customers
+
+        This endpoint is only available when ALLOW_DELETE_ALL is enabled
+        """
+        if not app.config["ALLOW_DELETE_ALL"]:
+            abort(status.HTTP_403_FORBIDDEN, "Deleting all Customers is not enabled.")
+        Customer.remove_all()
+        logger.info("All Customers were deleted")
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+######################################################################
+#  PATH: /customers/bulk
+######################################################################
+@api.route("/customers/bulk", strict_slashes=False)
+class CustomerBulkCollection(Resource):
+    """Handles creating many Customers in a single request"""
+
+    # ------------------------------------------------------------------
+    # ADD MANY NEW CUSTOMERS
+    # ------------------------------------------------------------------
+    @api.doc("create_customers_bulk")
+    @api.response(400, "The posted data was not valid")
+    @api.expect([create_model])
+    @api.response(201, "Customers created", [customer_model])
+    def post(self):
+        """
+        Creates many Customers
+        This endpoint will create all of the Customers in the list that is posted
+        """
+        check_content_type("application/json")
+        data = api.payload
+        if not isinstance(data, list):
+            raise DataValidationError(
+                "Invalid request: body must be a list of Customers"
+            )
+        customers = [Customer().deserialize(item) for item in data]
+        Customer.bulk_create(customers)
+        logger.info("[%s] Customers created", len(customers))
+        results = [customer.serialize() for customer in customers]
+        return results, status.HTTP_201_CREATED
+
 
 ######################################################################
 #  PATH: /customers/{id}/action
 ######################################################################
-@api.route("/customers/<customer_id>/action")
+@api.route("/customers/<int:customer_id>/action")
 @api.param("customer_id", "The Customer identifier")
 class ActionResource(Resource):
     """Perform actions on a Customer"""
@@ -294,9 +401,10 @@ class ActionResource(Resource):
         Perform an action on a Customer
         This endpoint will perform a suspend on a Customer
         """
-        app.logger.info(
+        logger.info(
             "Request to Perform action on Customer with id [%s]", customer_id
         )
+        check_content_type("application/json")
         customer = Customer.find(customer_id)
         if not customer:
             abort(
@@ -304,13 +412,56 @@ class ActionResource(Resource):
                 f"Customer with id [{customer_id}] was not found.",
             )
 
-        data = api.payload
-        action = data.get("action", "").lower()
-
-        if action == "suspend":
-            app.logger.info("Suspending customer with id [%s]", customer_id)
+        # the action body is tiny, so parse it straight from the raw bytes
+        raw = request.get_data(cache=False)
+        try:
+            data = orjson.loads(raw) if raw else {}
+        except orjson.JSONDecodeError as error:
+            raise DataValidationError(f"Invalid JSON: {error}") from error
+        if not isinstance(data, dict):
+            raise DataValidationError("Invalid request: body must be a JSON object")
+        action = data.get("action", "")
+        if not isinstance(action, str):
+            raise DataValidationError("Invalid request: action must be a string")
+
+        if action.lower() == "suspend":
+            logger.info("Suspending customer with id [%s]", customer_id)
             result = customer.serialize()
             result["action"] = "suspended"
             return result, status.HTTP_200_OK
 
         api.abort(status.HTTP_400_BAD_REQUEST, f"Action '{action}' is not supported.")
+
+
+######################################################################
+#  U T I L I T Y   F U N C T I O N S
+######################################################################
+def check_content_type(content_type):
+    """Checks that the media type is correct"""
+    if request.mimetype == content_type:
+        return
+    logger.error("Invalid Content-Type: %s", request.content_type)
+    abort(
+        status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+        f"Content-Type must be {content_type}",
+    )
+
+
+def etag_for(*parts):
+    """Returns an ETag value made from the version parts of a resource"""
+    return "-".join(
+        part.strftime("%Y%m%d%H%M%S%f") if isinstance(part, datetime) else str(part)
+        for part in parts
+    )
+
+
+@cache
+def customer_path_prefix():
+    """Returns the URL path of a Customer without its id, built once"""
+    path = api.url_for(CustomerResource, customer_id=0)
+    return path.rpartition("/")[0] + "/"
+
+
+def customer_path(customer_id):
+    """Returns the URL path of the Customer with the given id"""
+    return customer_path_prefix() + str(customer_id)
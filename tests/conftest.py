@@ -0,0 +1,43 @@
+"""
+Test configuration shared by every test module
+"""
+
+import os
+import logging
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+
+def worker_database_uri(uri, worker):
+    """Returns uri pointed at a database of its own for a pytest-xdist worker
+
+    Every worker process already has a separate in-memory SQLite database, so
+    only databases that live in a file or on a server get a per-worker name
+    """
+    url = make_url(uri)
+    if not worker or not url.database or url.database == ":memory:":
+        return uri
+    if url.get_backend_name() == "sqlite":
+        return url.set(database=f"{url.database}.{worker}").render_as_string(hide_password=False)
+
+    name = f"{url.database}_{worker}"
+    engine = create_engine(url, isolation_level="AUTOCOMMIT")
+    with engine.connect() as connection:
+        found = connection.execute(
+            text("SELECT 1 FROM pg_database WHERE datname = :name"), {"name": name}
+        ).scalar()
+        if not found:
+            connection.exec_driver_sql(f'CREATE DATABASE "{name}"')
+    engine.dispose()
+    return url.set(database=name).render_as_string(hide_password=False)
+
+
+# Nothing reads the log output of a test run, so don't build the records at all
+logging.disable(logging.CRITICAL)
+
+# The unit tests only use portable SQL, so they run against an in-memory SQLite
+# database unless TEST_DATABASE_URI points them at a real server. This has to
+# happen before wsgi is imported, because the engine is built from the config.
+os.environ["DATABASE_URI"] = worker_database_uri(
+    os.getenv("TEST_DATABASE_URI", "sqlite://"), os.getenv("PYTEST_XDIST_WORKER")
+)
@@ -0,0 +1,72 @@
+"""
+Database fixture shared by the test cases that use the Customer table
+"""
+
+import os
+import logging
+from unittest import TestCase
+from sqlalchemy import text
+from sqlalchemy.orm import scoped_session, sessionmaker
+from wsgi import app
+from service.models import Customer, db
+
+# conftest.py points DATABASE_URI at the test database before wsgi is imported
+DATABASE_URI = os.getenv("DATABASE_URI", "sqlite://")
+
+
+class DatabaseTestCase(TestCase):
+    """Runs every test of a class inside one transaction that is rolled back"""
+
+    @classmethod
+    def setUpClass(cls):
+        """This runs once before the tests of the class"""
+        app.config["TESTING"] = True
+        app.config["DEBUG"] = False
+        app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URI
+        app.logger.setLevel(logging.CRITICAL)
+        app.app_context().push()
+        # Run every test on one connection inside a transaction that is never
+        # committed; the session's commits only release SAVEPOINTs within it
+        cls.connection = db.engine.connect()
+        if db.engine.dialect.name == "sqlite":
+            # pysqlite defers BEGIN, which breaks SAVEPOINT, so issue it ourselves
+            cls.connection.connection.driver_connection.isolation_level = None
+        cls.transaction = cls.connection.begin()
+        if db.engine.dialect.name == "sqlite":
+            cls.connection.exec_driver_sql("BEGIN")
+        cls.app_session = db.session
+        # nothing outside a test writes to its rows, so don't reload them after commit
+        db.session = scoped_session(
+            sessionmaker(
+                bind=cls.connection,
+                join_transaction_mode="create_savepoint",
+                expire_on_commit=False,
+            )
+        )
+        # clean up what is already there; TRUNCATE resets the table in one step on Postgres
+        if db.engine.dialect.name == "postgresql":
+            db.session.execute(text("TRUNCATE TABLE customer RESTART IDENTITY CASCADE"))
+        else:
+            db.session.query(Customer).delete()
+        db.session.commit()
+
+    @classmethod
+    def tearDownClass(cls):
+        """This runs once after the tests of the class"""
+        db.session.remove()
+        db.session = cls.app_session
+        cls.transaction.rollback()
+        if db.engine.dialect.name == "sqlite":
+            cls.connection.connection.driver_connection.isolation_level = ""
+        cls.connection.close()
+
+    def setUp(self):
+        """This runs before each test"""
+        # everything the test does is rolled back to here afterwards
+        self.savepoint = self.connection.begin_nested()
+
+    def tearDown(self):
+        """This runs after each test"""
+        # keep the session for the next test, tearDownClass removes it
+        db.session.rollback()
+        self.savepoint.rollback()
@@ -20,13 +20,43 @@ CLI Command Extensions for Flask
 
 # pylint: disable=duplicate-code
 import os
-from unittest import TestCase
+from unittest import TestCase, skipUnless
 from unittest.mock import patch, MagicMock
 from click.testing import CliRunner
+from sqlalchemy.orm import scoped_session, sessionmaker
 
 # pylint: disable=unused-import
 from wsgi import app  # noqa: F401
-from service.common.cli_commands import db_create  # noqa: E402
+from service.common.cli_commands import (  # noqa: E402
+    UPGRADE_STATEMENTS,
+    db_create,
+    db_upgrade,
+)
+from service.models import db  # noqa: E402
+
+# The customer table as the first release created it
+BASELINE_TABLE = """
+CREATE TABLE customer (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(63),
+    address VARCHAR(256),
+    email VARCHAR(50),
+    phonenumber VARCHAR(25)
+)
+"""
+# The email indexes as the release that first indexed the table created them
+UNIQUE_EMAIL_INDEXES = (
+    "CREATE UNIQUE INDEX ix_customer_email ON customer (email)",
+    "CREATE INDEX ix_customer_email_lower ON customer (lower(email))",
+)
+UPGRADED_INDEXES = {
+    "customer_pkey",
+    "ix_customer_name",
+    "ix_customer_address",
+    "ix_customer_phonenumber",
+    "ix_customer_email_lower",
+    "ix_customer_updated_at",
+}
 
 
 class TestFlaskCLI(TestCase):
@@ -42,3 +72,90 @@ class TestFlaskCLI(TestCase):
         with patch.dict(os.environ, {"FLASK_APP": "wsgi:app"}, clear=True):
             result = self.runner.invoke(db_create)
             self.assertEqual(result.exit_code, 0)
+
+    @patch("service.common.cli_commands.db")
+    def test_db_upgrade(self, db_mock):
+        """It should run every upgrade statement and commit them"""
+        with patch.dict(os.environ, {"FLASK_APP": "wsgi:app"}, clear=True):
+            result = self.runner.invoke(db_upgrade)
+            self.assertEqual(result.exit_code, 0)
+        self.assertEqual(db_mock.session.execute.call_count, len(UPGRADE_STATEMENTS))
+        db_mock.session.commit.assert_called_once()
+
+
+@skipUnless(
+    os.getenv("DATABASE_URI", "").startswith("postgresql"),
+    "db-upgrade runs PostgreSQL DDL",
+)
+class TestDatabaseUpgrade(TestCase):
+    """Database Upgrade Tests"""
+
+    def setUp(self):
+        self.runner = CliRunner()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        # build the old table in a schema of its own, the rollback drops it again
+        self.connection = db.engine.connect()
+        self.transaction = self.connection.begin()
+        self.connection.exec_driver_sql("CREATE SCHEMA upgrade_test")
+        self.connection.exec_driver_sql("SET LOCAL search_path TO upgrade_test")
+        self.connection.exec_driver_sql(BASELINE_TABLE)
+        self.connection.exec_driver_sql(
+            "INSERT INTO customer (name, address, email, phonenumber)"
+            " VALUES ('Ann', '1 Main St', 'ann@example.com', '555-0100')"
+        )
+        session = scoped_session(
+            sessionmaker(bind=self.connection, join_transaction_mode="create_savepoint")
+        )
+        self.session_patch = patch.object(db, "session", session)
+        self.session_patch.start()
+
+    def tearDown(self):
+        self.session_patch.stop()
+        self.transaction.rollback()
+        self.connection.close()
+        self.app_context.pop()
+
+    def _upgrade_twice(self):
+        """Runs db-upgrade twice, as a second deploy of the same release would"""
+        with patch.dict(os.environ, {"FLASK_APP": "wsgi:app"}, clear=True):
+            for _ in range(2):
+                result = self.runner.invoke(db_upgrade)
+                self.assertEqual(result.exit_code, 0, result.output)
+
+    def _indexes(self):
+        """Returns the index definitions of the customer table by name"""
+        rows = self.connection.exec_driver_sql(
+            "SELECT indexname, indexdef FROM pg_indexes"
+            " WHERE schemaname = 'upgrade_test' AND tablename = 'customer'"
+        )
+        return dict(rows.all())
+
+    def _assert_upgraded(self):
+        """Checks that the table and its indexes match the current model"""
+        column = self.connection.exec_driver_sql(
+            "SELECT is_nullable, column_default FROM information_schema.columns"
+            " WHERE table_schema = 'upgrade_test' AND table_name = 'customer'"
+            " AND column_name = 'updated_at'"
+        ).one()
+        self.assertEqual(column.is_nullable, "NO")
+        self.assertIn("statement_timestamp()", column.column_default)
+        stamped = self.connection.exec_driver_sql(
+            "SELECT count(*) FROM customer WHERE updated_at IS NOT NULL"
+        ).scalar()
+        self.assertEqual(stamped, 1)
+        indexes = self._indexes()
+        self.assertEqual(set(indexes), UPGRADED_INDEXES)
+        self.assertIn("CREATE UNIQUE INDEX", indexes["ix_customer_email_lower"])
+
+    def test_upgrade_baseline_table(self):
+        """It should upgrade the table of the first release to the current schema"""
+        self._upgrade_twice()
+        self._assert_upgraded()
+
+    def test_upgrade_case_sensitive_unique_email(self):
+        """It should move email uniqueness from the plain to the lower(email) index"""
+        for statement in UNIQUE_EMAIL_INDEXES:
+            self.connection.exec_driver_sql(statement)
+        self._upgrade_twice()
+        self._assert_upgraded()